@@ -3,17 +3,38 @@ Conversational chat module with Gemini API.
 Implements multi-turn Q&A with grounded responses.
 """
 import os
-from typing import List, Tuple, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple, Optional
+import numpy as np
+import faiss
 import google.generativeai as genai
+from ingest import ChunkLike
 from retriever import VectorRetriever
 from prompt import (
+    NOT_FOUND_RESPONSE,
     SYSTEM_INSTRUCTION,
     build_grounded_prompt,
     rewrite_query_with_history,
+    rewrite_query_locally,
     parse_response_for_citations,
     is_not_found_response
 )
 
+# Retrieval cache settings
+QUERY_CACHE_SIZE = 128  # Exact (normalized string) cache entries
+
+# Number of past conversation turns included in the answer prompt
+HISTORY_TURNS = 3
+
+# Words that mark a query as a follow-up needing context from history
+_PRONOUNS = frozenset(["it", "they", "them", "this", "that", "these", "those", "he", "she"])
+
+
+def _query_terms(query: str) -> frozenset:
+    """Lowercased words of a query, ignoring order and trailing punctuation."""
+    return frozenset(word.strip("?.,!;:\"'") for word in query.lower().split())
+
 
 class RAGChatAgent:
     """Conversational RAG agent using Gemini."""
@@ -24,7 +45,8 @@ class RAGChatAgent:
         gemini_api_key: Optional[str],
         model_name: str = "gemini-1.5-pro",
         top_k_retrieval: int = 5,
-        debug_mode: bool = True
+        debug_mode: bool = True,
+        use_llm_rewrite: bool = False
     ):
         """
         Initialize the chat agent.
@@ -35,10 +57,13 @@ class RAGChatAgent:
             model_name: Gemini model to use (gemini-1.5-pro or gemini-1.5-flash)
             top_k_retrieval: Number of chunks to retrieve
             debug_mode: Whether to print retrieval debug info
+            use_llm_rewrite: Rewrite follow-ups with an extra Gemini call instead
+                of the local heuristic (slower, one more API request per turn)
         """
         self.retriever = retriever
         self.top_k = top_k_retrieval
         self.debug_mode = debug_mode
+        self.use_llm_rewrite = use_llm_rewrite
         self.api_key = gemini_api_key
         self.fallback_mode = gemini_api_key is None
         
@@ -73,6 +98,90 @@ class RAGChatAgent:
         
         # Conversation history: list of (user_query, assistant_response) tuples
         self.conversation_history: List[Tuple[str, str]] = []
+        
+        # Retrieval cache: normalized query -> (results, query embedding),
+        # valid for the retriever index version it was filled from
+        self._query_cache: "OrderedDict[str, Tuple[List[Tuple[ChunkLike, float]], np.ndarray]]" = OrderedDict()
+        self._query_cache_version = retriever.index_version
+        
+        # Episodic memory: embeddings of past (user, assistant) turns, row i
+        # matches conversation_history[i]; filled lazily by _relevant_history
+        self._history_index = faiss.IndexFlatIP(retriever.embedding_dim)
+    
+    def _retrieve_cached(self, query: str) -> Tuple[List[Tuple[ChunkLike, float]], np.ndarray]:
+        """
+        Retrieve chunks for a query, reusing results for repeated queries.
+        
+        Exact repeats (after case/whitespace normalization) skip both the
+        embedding model and the FAISS search. Near-duplicates are handled by
+        the retriever's semantic cache.
+        
+        Args:
+            query: Standalone query string
+            
+        Returns:
+            Tuple of (list of (chunk, similarity_score) tuples, query embedding)
+        """
+        # Results cached before the index was rebuilt or reloaded point at
+        # the replaced chunks
+        if self._query_cache_version != self.retriever.index_version:
+            self._clear_retrieval_cache()
+            self._query_cache_version = self.retriever.index_version
+        
+        key = " ".join(query.lower().split())
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+        
+        query_embedding = self.retriever.encode_query(query)
+        results = self.retriever.search_embedding(query_embedding, top_k=self.top_k)
+        
+        self._query_cache[key] = (results, query_embedding)
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        
+        return results, query_embedding
+    
+    def _clear_retrieval_cache(self) -> None:
+        """Drop all cached retrieval results."""
+        self._query_cache.clear()
+    
+    def _relevant_history(self, query_embedding: np.ndarray) -> List[Tuple[str, str]]:
+        """
+        Select the past turns most relevant to the current query.
+        
+        The most recent turn is always kept, since follow-ups usually refer
+        to it; the remaining slots go to the earlier turns most similar to
+        the query. Prompt size therefore stays fixed however long the
+        conversation grows.
+        
+        Args:
+            query_embedding: Normalized embedding of the standalone query
+            
+        Returns:
+            Up to HISTORY_TURNS (user_msg, assistant_msg) tuples in chronological order
+        """
+        history = self.conversation_history
+        if len(history) <= HISTORY_TURNS:
+            return history
+        
+        # Embed turns recorded since the last lookup
+        pending = history[self._history_index.ntotal:]
+        if pending:
+            self._history_index.add(self.retriever.encode_queries(
+                [f"{user_msg}\n{assistant_msg}" for user_msg, assistant_msg in pending]
+            ))
+        
+        _, indices = self._history_index.search(query_embedding, HISTORY_TURNS)
+        selected = {len(history) - 1}
+        for idx in indices[0]:
+            if len(selected) == HISTORY_TURNS:
+                break
+            if idx >= 0:
+                selected.add(int(idx))
+        
+        return [history[i] for i in sorted(selected)]
     
     def _rewrite_query_if_needed(self, query: str) -> str:
         """
@@ -84,88 +193,203 @@ class RAGChatAgent:
         Returns:
             Rewritten standalone query
         """
-        # Skip rewrite in fallback mode or if no history
-        if self.fallback_mode or not self.conversation_history:
+        # Skip rewrite if no history
+        if not self.conversation_history:
             return query
         
         # Simple heuristic: if query is short or has pronouns, rewrite it
-        pronouns = ["it", "they", "them", "this", "that", "these", "those", "he", "she"]
-        needs_rewrite = (
-            len(query.split()) < 5 or
-            any(pronoun in query.lower().split() for pronoun in pronouns)
-        )
+        tokens = query.lower().split()
+        needs_rewrite = len(tokens) < 5 or not _PRONOUNS.isdisjoint(tokens)
         
         if not needs_rewrite:
             return query
         
-        try:
-            rewrite_prompt = rewrite_query_with_history(query, self.conversation_history)
-            response = self.model.generate_content(rewrite_prompt)
-            rewritten = response.text.strip()
-            
-            if self.debug_mode:
-                print(f"\n[QUERY REWRITE]")
-                print(f"Original: {query}")
-                print(f"Rewritten: {rewritten}")
+        # The LLM rewrite needs a model; otherwise resolve follow-ups locally
+        if not self.use_llm_rewrite or self.fallback_mode:
+            rewritten = rewrite_query_locally(query, self.conversation_history)
+        else:
+            try:
+                rewrite_prompt = rewrite_query_with_history(query, self.conversation_history)
+                response = self.model.generate_content(rewrite_prompt)
+                rewritten = response.text.strip()
+            except Exception as e:
+                print(f"Warning: Query rewrite failed: {e}")
+                return query
+        
+        if self.debug_mode:
+            print(f"\n[QUERY REWRITE]")
+            print(f"Original: {query}")
+            print(f"Rewritten: {rewritten}")
+        
+        return rewritten
+    
+    def _rewrite_and_retrieve(self, user_query: str) -> Tuple[str, Tuple[List[Tuple[ChunkLike, float]], np.ndarray]]:
+        """
+        Rewrite the query if needed and retrieve chunks for it.
+        
+        When the rewrite is a Gemini call, retrieval for the original query
+        runs while the rewrite is in flight. A second retrieval is only
+        issued if the rewrite changed the query's terms, so an unchanged
+        rewrite costs no extra latency.
+        
+        Args:
+            user_query: User's question
             
-            return rewritten
-        except Exception as e:
-            print(f"Warning: Query rewrite failed: {e}")
-            return query
+        Returns:
+            Tuple of (standalone query, _retrieve_cached result for it)
+        """
+        if not self.use_llm_rewrite or self.fallback_mode or not self.conversation_history:
+            standalone_query = self._rewrite_query_if_needed(user_query)
+            return standalone_query, self._retrieve_cached(standalone_query)
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            rewrite_future = executor.submit(self._rewrite_query_if_needed, user_query)
+            retrieval = self._retrieve_cached(user_query)
+            standalone_query = rewrite_future.result()
+        
+        if _query_terms(standalone_query) != _query_terms(user_query):
+            retrieval = self._retrieve_cached(standalone_query)
+        
+        return standalone_query, retrieval
     
-    def answer_query(self, user_query: str) -> str:
+    def answer_query(self, user_query: str, retrieved_chunks: Optional[List[Tuple[ChunkLike, float]]] = None) -> str:
         """
         Answer a user query with grounded response.
         
         Args:
             user_query: User's question
+            retrieved_chunks: Chunks already retrieved for user_query (e.g. by
+                VectorRetriever.retrieve_batch); skips rewrite and retrieval
             
         Returns:
             Grounded response with citations
         """
-        # Step 1: Rewrite query if it's a follow-up
-        standalone_query = self._rewrite_query_if_needed(user_query)
+        for _ in self.answer_query_stream(user_query, retrieved_chunks):
+            pass
+        return self.conversation_history[-1][1]
+    
+    def answer_query_stream(
+        self,
+        user_query: str,
+        retrieved_chunks: Optional[List[Tuple[ChunkLike, float]]] = None
+    ) -> Iterator[str]:
+        """
+        Answer a user query, yielding the response text as it is generated.
+        
+        The complete answer is added to the conversation history once the
+        stream is exhausted.
         
-        # Step 2: Retrieve relevant chunks
-        retrieved_chunks = self.retriever.retrieve(standalone_query, top_k=self.top_k)
+        Args:
+            user_query: User's question
+            retrieved_chunks: Chunks already retrieved for user_query; skips
+                rewrite and retrieval
+            
+        Yields:
+            Pieces of the grounded response
+        """
+        # Steps 1-2: Rewrite query if it's a follow-up and retrieve relevant chunks
+        if retrieved_chunks is None:
+            standalone_query, (retrieved_chunks, query_embedding) = self._rewrite_and_retrieve(user_query)
+        else:
+            standalone_query = user_query
+            query_embedding = self.retriever.encode_query(user_query)
         
         # Step 3: Print debug info
         if self.debug_mode:
             self.retriever.print_retrieval_debug(standalone_query, retrieved_chunks)
         
-        # Step 4: Handle fallback mode (no LLM)
+        # Step 4: Handle fallback mode (no LLM) and off-topic queries
         if self.fallback_mode:
             answer = self._generate_fallback_response(user_query, retrieved_chunks)
+            yield answer
+        elif not retrieved_chunks:
+            # Nothing scored above the retriever's threshold: the model could
+            # only refuse, so skip the API call
+            answer = NOT_FOUND_RESPONSE
+            yield answer
         else:
             # Step 5: Build grounded prompt
             prompt = build_grounded_prompt(
                 query=user_query,  # Use original query in prompt
                 retrieved_chunks=retrieved_chunks,
-                conversation_history=self.conversation_history
+                conversation_history=self._relevant_history(query_embedding)
             )
             
-            # Step 6: Generate response with Gemini
+            # Step 6: Stream response from Gemini
+            pieces = []
             try:
                 full_prompt = f"{SYSTEM_INSTRUCTION}\n\n{prompt}"
-                response = self.model.generate_content(full_prompt)
-                answer = response.text.strip()
+                response = self.model.generate_content(full_prompt, stream=True)
+                for chunk in response:
+                    pieces.append(chunk.text)
+                    yield chunk.text
+                answer = "".join(pieces).strip()
             except Exception as e:
                 print(f"\n⚠️  API Error: {e}")
                 print("Falling back to retrieval-only mode for this query...\n")
                 answer = self._generate_fallback_response(user_query, retrieved_chunks)
+                yield ("\n\n" if pieces else "") + answer
         
         # Step 7: Add to conversation history
         self.conversation_history.append((user_query, answer))
+    
+    def answer_queries(self, queries: List[str], max_workers: int = 8) -> List[str]:
+        """
+        Answer several independent questions concurrently.
+        
+        Chunks for all questions are retrieved with one batched search and
+        the Gemini requests are issued in parallel, so the batch costs
+        roughly one API round-trip instead of one per question. Questions
+        are answered standalone: they are not rewritten against, nor added
+        to, the conversation history.
         
-        return answer
+        Args:
+            queries: Questions to answer
+            max_workers: Maximum concurrent requests (1 answers serially)
+            
+        Returns:
+            Grounded responses, in the same order as queries
+        """
+        if not queries:
+            return []
+        
+        retrieved = self.retriever.retrieve_batch(queries, top_k=self.top_k)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._generate_answer, queries, retrieved))
     
-    def _generate_fallback_response(self, query: str, chunks: List[Tuple]) -> str:
+    def _generate_answer(self, query: str, retrieved_chunks: List[Tuple[ChunkLike, float]]) -> str:
+        """
+        Generate a grounded answer for a standalone question (no history).
+        
+        Args:
+            query: User's question
+            retrieved_chunks: Retrieved (chunk, score) tuples
+            
+        Returns:
+            Grounded response with citations
+        """
+        if self.fallback_mode:
+            return self._generate_fallback_response(query, retrieved_chunks)
+        if not retrieved_chunks:
+            return NOT_FOUND_RESPONSE
+        
+        prompt = build_grounded_prompt(query=query, retrieved_chunks=retrieved_chunks)
+        try:
+            response = self.model.generate_content(f"{SYSTEM_INSTRUCTION}\n\n{prompt}")
+            return response.text.strip()
+        except Exception as e:
+            print(f"\n⚠️  API Error: {e}")
+            print("Falling back to retrieval-only mode for this query...\n")
+            return self._generate_fallback_response(query, retrieved_chunks)
+    
+    def _generate_fallback_response(self, query: str, chunks: List[Tuple[ChunkLike, float]]) -> str:
         """
         Generate a simple response using only retrieved chunks (no LLM).
         
         Args:
             query: User's question
-            chunks: Retrieved document chunks as list of (PDFChunk, score) tuples
+            chunks: Retrieved document chunks as list of (chunk, score) tuples
             
         Returns:
             Response with retrieved content
@@ -173,20 +397,18 @@ class RAGChatAgent:
         if not chunks:
             return "[FALLBACK MODE] No relevant content found in the document."
         
-        response = "[FALLBACK MODE - Retrieval Only]\n\n"
-        response += f"Found {len(chunks)} relevant passages:\n\n"
+        parts = [
+            "[FALLBACK MODE - Retrieval Only]\n\n",
+            f"Found {len(chunks)} relevant passages:\n\n"
+        ]
         
         for i, (chunk, score) in enumerate(chunks, 1):
-            response += f"--- Passage {i} (Page {chunk.page_number}, Similarity: {score:.3f}) ---\n"
-            response += chunk.text[:500]  # Show first 500 chars
-            if len(chunk.text) > 500:
-                response += "...\n"
-            else:
-                response += "\n"
-            response += "\n"
-        
-        response += "\n💡 Note: Set GEMINI_API_KEY to get AI-generated answers instead of raw passages."
-        return response
+            parts.append(f"--- Passage {i} (Page {chunk.page_number}, Similarity: {score:.3f}) ---\n")
+            parts.append(chunk.text[:500])  # Show first 500 chars
+            parts.append("...\n\n" if len(chunk.text) > 500 else "\n\n")
+        
+        parts.append("\n💡 Note: Set GEMINI_API_KEY to get AI-generated answers instead of raw passages.")
+        return "".join(parts)
     
     def chat_loop(self) -> None:
         """
@@ -210,11 +432,11 @@ class RAGChatAgent:
                     print("\nGoodbye!")
                     break
                 
-                # Get answer
-                answer = self.answer_query(user_input)
-                
-                # Print answer
-                print(f"\nAssistant: {answer}")
+                # Print answer as it streams in
+                print("\nAssistant: ", end="", flush=True)
+                for piece in self.answer_query_stream(user_input):
+                    print(piece, end="", flush=True)
+                print()
                 
             except KeyboardInterrupt:
                 print("\n\nChat interrupted. Goodbye!")
@@ -225,11 +447,14 @@ class RAGChatAgent:
     def reset_history(self) -> None:
         """Clear conversation history."""
         self.conversation_history = []
+        self._history_index.reset()
+        self._clear_retrieval_cache()
+        self.retriever.clear_caches()
         print("Conversation history cleared.")
     
-    def get_history(self) -> List[Tuple[str, str]]:
-        """Get conversation history."""
-        return self.conversation_history.copy()
+    def get_history(self) -> Tuple[Tuple[str, str], ...]:
+        """Get conversation history as an immutable snapshot."""
+        return tuple(self.conversation_history)
 
 
 if __name__ == "__main__":
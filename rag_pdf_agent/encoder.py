@@ -0,0 +1,283 @@
+"""
+Lightweight embedding encoders.
+OnnxEncoder exports a sentence-transformers model to int8-quantized ONNX and
+encodes with it; FastQueryEncoder runs the torch model without the
+sentence-transformers encode() machinery for short query batches.
+"""
+import inspect
+import os
+from typing import List
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; fall back to NumPy pooling
+    njit = None
+    prange = range
+
+
+def available_cpus() -> int:
+    """
+    Count the CPUs this process may run on.
+    
+    Honors the affinity mask where the OS exposes it, so containers and
+    pinned processes don't size thread pools by the host's core count.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _fast_tokenizer(tokenizer, max_length: int):
+    """
+    Build a Rust tokenizer that truncates and pads batches itself.
+    
+    Works on a copy, so the tokenizer shared with sentence-transformers
+    keeps its own settings.
+    
+    Args:
+        tokenizer: Hugging Face fast tokenizer
+        max_length: Maximum sequence length (longer inputs are truncated)
+        
+    Returns:
+        Configured tokenizers.Tokenizer
+    """
+    from tokenizers import Tokenizer
+    
+    fast = Tokenizer.from_str(tokenizer.backend_tokenizer.to_str())
+    fast.enable_truncation(max_length=max_length)
+    fast.enable_padding(pad_id=tokenizer.pad_token_id, pad_token=tokenizer.pad_token)
+    return fast
+
+
+def _tokenize(fast, texts: List[str]):
+    """Tokenize texts into padded int64 (input_ids, attention_mask) arrays."""
+    encodings = fast.encode_batch(texts)
+    input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+    attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+    return input_ids, attention_mask
+
+
+def _mean_pool_normalize_py(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Mean pooling over real tokens, then L2 normalization."""
+    mask = mask[:, :, None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled
+
+
+def _pool_normalize_kernel(hidden, mask, out):
+    """
+    Fused mean pooling + L2 normalization, one sequence per iteration.
+    
+    Reads each real token's hidden state once and skips padding entirely;
+    the NumPy version materializes hidden * mask and reads it twice more.
+    """
+    batch, length, dim = hidden.shape
+    for b in prange(batch):
+        count = 0
+        for t in range(length):
+            if mask[b, t]:
+                count += 1
+                for d in range(dim):
+                    out[b, d] += hidden[b, t, d]
+        
+        scale = 1.0 / max(count, 1)
+        sq_sum = 0.0
+        for d in range(dim):
+            out[b, d] *= scale
+            sq_sum += out[b, d] * out[b, d]
+        
+        inv_norm = 1.0 / max(np.sqrt(sq_sum), 1e-12)
+        for d in range(dim):
+            out[b, d] *= inv_norm
+
+
+if njit is not None:
+    _pool_normalize_kernel = njit(parallel=True, fastmath=True, cache=True)(_pool_normalize_kernel)
+    
+    def _mean_pool_normalize(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Mean pooling over real tokens, then L2 normalization."""
+        out = np.zeros((hidden.shape[0], hidden.shape[2]), dtype=np.float32)
+        _pool_normalize_kernel(np.ascontiguousarray(hidden, dtype=np.float32), mask, out)
+        return out
+else:
+    _mean_pool_normalize = _mean_pool_normalize_py
+
+
+class _HiddenStateModule(torch.nn.Module):
+    """Wraps a Hugging Face model so it exports with two tensor inputs."""
+    
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+
+class OnnxEncoder:
+    """
+    Drop-in replacement for SentenceTransformer.encode backed by ONNX Runtime.
+    
+    The transformer is exported once to ONNX, quantized to int8 weights and
+    cached on disk. Encoding runs the graph through ONNX Runtime and applies
+    the same mean pooling + L2 normalization as the sentence-transformers model.
+    """
+    
+    def __init__(self, model: SentenceTransformer, export_dir: str, verbose: bool = True):
+        """
+        Initialize the encoder, exporting the model if no cached export exists.
+        
+        Args:
+            model: Loaded SentenceTransformer to export
+            export_dir: Directory for the cached ONNX files
+            verbose: Print a status line when exporting
+        """
+        import onnxruntime as ort
+        
+        self.verbose = verbose
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self.embedding_dim = model.get_sentence_embedding_dimension()
+        self._fast_tokenizer = _fast_tokenizer(self.tokenizer, self.max_seq_length)
+        
+        quantized_path = os.path.join(export_dir, "model.int8.onnx")
+        if not os.path.exists(quantized_path):
+            self._export(model, export_dir, quantized_path)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = available_cpus()
+        self.session = ort.InferenceSession(
+            quantized_path,
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+    
+    def _export(self, model: SentenceTransformer, export_dir: str, quantized_path: str) -> None:
+        """Export the transformer to ONNX and quantize its weights to int8."""
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        
+        if self.verbose:
+            print(f"Exporting embedding model to ONNX: {export_dir}")
+        os.makedirs(export_dir, exist_ok=True)
+        fp32_path = os.path.join(export_dir, "model.onnx")
+        
+        sample = self.tokenizer(["export sample"], return_tensors="pt")
+        export_kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False  # Dynamic axes need the TorchScript exporter
+        
+        torch.onnx.export(
+            _HiddenStateModule(model[0].auto_model).eval(),
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+            **export_kwargs
+        )
+        quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.embedding_dim
+    
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        Encode sentences into L2-normalized float32 embeddings.
+        
+        Args:
+            sentences: Texts to encode
+            batch_size: Number of texts per forward pass
+            show_progress_bar: Accepted for API compatibility (ignored)
+            convert_to_numpy: Accepted for API compatibility (always NumPy)
+        
+        Returns:
+            Array of shape (len(sentences), embedding_dim)
+        """
+        embeddings = np.empty((len(sentences), self.embedding_dim), dtype=np.float32)
+        
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            input_ids, mask = _tokenize(self._fast_tokenizer, batch)
+            hidden = self.session.run(None, {
+                "input_ids": input_ids,
+                "attention_mask": mask,
+            })[0]
+            embeddings[start:start + len(batch)] = _mean_pool_normalize(hidden, mask)
+        
+        return embeddings
+
+
+class FastQueryEncoder:
+    """
+    Query encoder that calls the torch transformer directly.
+    
+    SentenceTransformer.encode() sorts, batches and collates inputs in
+    Python, which dominates the cost of embedding one short query. This
+    tokenizes with the Rust tokenizer and runs a single forward pass. Only
+    Transformer + mean Pooling (+ Normalize) models are supported; check
+    with supports() first.
+    """
+    
+    def __init__(self, model: SentenceTransformer):
+        """
+        Initialize the encoder.
+        
+        Args:
+            model: Loaded SentenceTransformer (see supports())
+        """
+        self.model = model[0].auto_model
+        self.device = model.device
+        self._fast_tokenizer = _fast_tokenizer(model.tokenizer, model.max_seq_length)
+    
+    @staticmethod
+    def supports(model: SentenceTransformer) -> bool:
+        """Check whether model is a plain mean-pooling text encoder."""
+        modules = list(model)
+        if len(modules) not in (2, 3) or not hasattr(modules[0], "auto_model"):
+            return False
+        if getattr(modules[0], "do_lower_case", False) or not getattr(model.tokenizer, "is_fast", False):
+            return False
+        if len(modules) == 3 and type(modules[2]).__name__ != "Normalize":
+            return False
+        
+        pooling = modules[1]
+        if hasattr(pooling, "get_pooling_mode_str"):
+            mode = pooling.get_pooling_mode_str()
+        else:
+            mode = getattr(pooling, "pooling_mode", None)
+        return type(pooling).__name__ == "Pooling" and mode == "mean"
+    
+    def encode(self, sentences: List[str], **kwargs) -> np.ndarray:
+        """
+        Encode sentences into L2-normalized float32 embeddings.
+        
+        Args:
+            sentences: Texts to encode (in one batch)
+        
+        Returns:
+            Array of shape (len(sentences), embedding_dim)
+        """
+        input_ids, mask = _tokenize(self._fast_tokenizer, sentences)
+        with torch.inference_mode():
+            hidden = self.model(
+                input_ids=torch.from_numpy(input_ids).to(self.device),
+                attention_mask=torch.from_numpy(mask).to(self.device)
+            )[0]
+        return _mean_pool_normalize(hidden.float().cpu().numpy(), mask)
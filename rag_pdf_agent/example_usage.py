@@ -74,10 +74,9 @@ def example_batch_questions():
         "What are the main products?"
     ]
     
-    results = []
-    for q in questions:
-        answer = agent.answer_query(q)
-        results.append({"question": q, "answer": answer})
+    # Answer all questions concurrently in one batch
+    answers = agent.answer_queries(questions)
+    results = [{"question": q, "answer": a} for q, a in zip(questions, answers)]
     
     # Process results
     for r in results:
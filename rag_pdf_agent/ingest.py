@@ -2,25 +2,357 @@
 PDF ingestion module.
 Extracts text from PDF, chunks it with overlap, and stores metadata.
 """
+import mmap
 import os
-from typing import List, Dict
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Union
+import numpy as np
 from pypdf import PdfReader
 from tqdm import tqdm
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to pure Python offsets
+    njit = None
+
+
+def _is_space(code: int) -> bool:
+    """ASCII whitespace test on a code point (space, \\t, \\n, \\v, \\f, \\r)."""
+    return code == 32 or 9 <= code <= 13
+
+
+def _snap_back(codes: np.ndarray, pos: int, lower: int) -> int:
+    """
+    Move a boundary back to just after the last whitespace in [lower, pos).
+    
+    Returns pos unchanged if the window has no whitespace.
+    """
+    for i in range(pos - 1, lower - 1, -1):
+        if _is_space(codes[i]):
+            return i + 1
+    return pos
+
+
+def _chunk_offsets_py(codes: np.ndarray, size: int, overlap: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute (start, end) character offsets of overlapping chunks.
+    
+    Boundaries are snapped to the nearest whitespace within the overlap
+    window so chunks do not cut words in half.
+    
+    Args:
+        codes: Code points of the text (one entry per character)
+        size: Chunk size in characters
+        overlap: Overlap between consecutive chunks in characters
+        
+    Returns:
+        Tuple of int64 arrays (starts, ends)
+    """
+    n = len(codes)
+    step = size - overlap
+    # Starts strictly increase, so there are at most n chunks
+    starts = np.empty(n, dtype=np.int64)
+    ends = np.empty(n, dtype=np.int64)
+    count = 0
+    start = 0
+    while start < n:
+        end = start + size
+        if end >= n:
+            end = n
+        else:
+            end = _snap_back(codes, end, end - overlap)
+        starts[count] = start
+        ends[count] = end
+        count += 1
+        
+        # Move forward by (chunk_size - overlap), never past a word start
+        nominal = start + step
+        if nominal < n:
+            start = _snap_back(codes, nominal, max(start + 1, nominal - overlap))
+        else:
+            start = nominal
+    return starts[:count], ends[:count]
+
+
+if njit is not None:
+    _is_space = njit(cache=True)(_is_space)
+    _snap_back = njit(cache=True)(_snap_back)
+    _chunk_offsets = njit(cache=True)(_chunk_offsets_py)
+else:
+    _chunk_offsets = _chunk_offsets_py
+
+
+# Below this many pages, process start-up costs more than it saves
+PARALLEL_MIN_PAGES = 16
+
+# Per-worker PdfReader, opened once by _init_page_worker
+_worker_reader = None
+
+
+def _init_page_worker(pdf_path: str) -> None:
+    """Open the PDF once in each extraction worker process."""
+    global _worker_reader
+    _worker_reader = PdfReader(pdf_path, strict=False)
+
+
+def _extract_one_page(page_num: int) -> Tuple[int, str]:
+    """
+    Extract the text of a single page in a worker process.
+    
+    Args:
+        page_num: 1-based page number
+        
+    Returns:
+        Tuple of (page_number, text)
+    """
+    return page_num, _worker_reader.pages[page_num - 1].extract_text() or ""
+
 
 class PDFChunk:
     """Represents a text chunk with metadata."""
+    __slots__ = ("text", "page_number", "chunk_id", "citation")
+    
     def __init__(self, text: str, page_number: int, chunk_id: int):
         self.text = text
         self.page_number = page_number
         self.chunk_id = chunk_id
+        self.citation = f"[p{page_number}:c{chunk_id}]"
+        
+    def __setstate__(self, state):
+        # Slotted pickles store (None, slots); pre-slots chunks.pkl files store a dict
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
+        # Older pickles predate the precomputed citation
+        self.citation = f"[p{self.page_number}:c{self.chunk_id}]"
         
     def __repr__(self):
         return f"PDFChunk(page={self.page_number}, chunk_id={self.chunk_id}, text_len={len(self.text)})"
     
     def get_citation(self) -> str:
         """Returns citation format [p{page}:c{chunk_id}]"""
-        return f"[p{self.page_number}:c{self.chunk_id}]"
+        return self.citation
+
+
+class ChunkView:
+    """
+    Read-only view of one chunk in a ChunkStore.
+    
+    Exposes the same attributes as PDFChunk but reads them from the store's
+    columns on access; the text is only decoded if it is actually used.
+    """
+    __slots__ = ("_store", "_index", "_text")
+    
+    def __init__(self, store: "ChunkStore", index: int):
+        self._store = store
+        self._index = index
+        self._text = None
+    
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._store._get_text(self._index)
+        return self._text
+    
+    @property
+    def page_number(self) -> int:
+        return int(self._store.page_numbers[self._index])
+    
+    @property
+    def chunk_id(self) -> int:
+        return int(self._store.chunk_ids[self._index])
+    
+    @property
+    def citation(self) -> str:
+        return self._store.citations[self._index]
+    
+    def __repr__(self):
+        return f"PDFChunk(page={self.page_number}, chunk_id={self.chunk_id}, text_len={len(self.text)})"
+    
+    def get_citation(self) -> str:
+        """Returns citation format [p{page}:c{chunk_id}]"""
+        return self.citation
+    
+    def to_chunk(self) -> PDFChunk:
+        """Materialize the view as a standalone PDFChunk."""
+        return PDFChunk(self.text, self.page_number, self.chunk_id)
+
+
+# Either a standalone chunk or a view into a ChunkStore; both expose text,
+# page_number, chunk_id and get_citation()
+ChunkLike = Union[PDFChunk, ChunkView]
+
+
+class ChunkStore:
+    """
+    Column-oriented storage for many chunks.
+    
+    Texts live in one list and page numbers / chunk IDs in contiguous int32
+    arrays. Indexing returns a PDFChunk built on the fly, so a store can be
+    used anywhere a list of PDFChunk objects is expected; view() returns a
+    lighter ChunkView that decodes the text only when it is read.
+    
+    A store saved with save() is reopened by load() without deserializing:
+    texts are sliced from a memory-mapped UTF-8 buffer on access.
+    """
+    
+    TEXT_FILE = "text_buf.bin"
+    OFFSETS_FILE = "offsets.npy"
+    META_FILE = "meta.npy"
+    
+    def __init__(self, texts: List[str], page_numbers, chunk_ids):
+        """
+        Initialize the store from parallel columns.
+        
+        Args:
+            texts: Chunk texts
+            page_numbers: Page number of each chunk
+            chunk_ids: Chunk ID of each chunk
+        """
+        self._texts = list(texts)
+        self._text_buf = None
+        self._text_offsets = None
+        self._citations = None
+        self.page_numbers = np.asarray(page_numbers, dtype=np.int32)
+        self.chunk_ids = np.asarray(chunk_ids, dtype=np.int32)
+    
+    @classmethod
+    def from_chunks(cls, chunks: List[PDFChunk]) -> "ChunkStore":
+        """Build a store from a list of PDFChunk objects."""
+        return cls(
+            [chunk.text for chunk in chunks],
+            [chunk.page_number for chunk in chunks],
+            [chunk.chunk_id for chunk in chunks]
+        )
+    
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        """Check whether store_dir contains a saved store."""
+        return all(
+            os.path.exists(os.path.join(store_dir, name))
+            for name in (cls.TEXT_FILE, cls.OFFSETS_FILE, cls.META_FILE)
+        )
+    
+    def save(self, store_dir: str) -> None:
+        """
+        Write the store as flat files: one UTF-8 text buffer, int64 text
+        offsets and an int32 (page_number, chunk_id) table.
+        
+        Args:
+            store_dir: Directory to write the files to
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        
+        # Write to temporary files and swap them in at the end: this store may
+        # be memory-mapped from store_dir itself, and truncating a mapped file
+        # in place would crash the next read from it
+        paths = [os.path.join(store_dir, name) for name in (self.TEXT_FILE, self.OFFSETS_FILE, self.META_FILE)]
+        text_tmp, offsets_tmp, meta_tmp = [path + ".tmp" for path in paths]
+        
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        with open(text_tmp, 'wb') as f:
+            for i in range(len(self)):
+                encoded = self._get_text(i).encode("utf-8")
+                f.write(encoded)
+                offsets[i + 1] = offsets[i] + len(encoded)
+        
+        with open(offsets_tmp, 'wb') as f:
+            np.save(f, offsets)
+        with open(meta_tmp, 'wb') as f:
+            np.save(f, np.stack([self.page_numbers, self.chunk_ids], axis=1))
+        
+        for tmp_path, path in zip((text_tmp, offsets_tmp, meta_tmp), paths):
+            os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, store_dir: str) -> "ChunkStore":
+        """
+        Open a store written by save() using memory maps.
+        
+        Args:
+            store_dir: Directory containing the store files
+            
+        Returns:
+            ChunkStore backed by the files in store_dir
+        """
+        meta = np.load(os.path.join(store_dir, cls.META_FILE), mmap_mode='r')
+        
+        store = cls.__new__(cls)
+        store._texts = None
+        store._citations = None
+        store._text_offsets = np.load(os.path.join(store_dir, cls.OFFSETS_FILE), mmap_mode='r')
+        store.page_numbers = meta[:, 0]
+        store.chunk_ids = meta[:, 1]
+        
+        text_path = os.path.join(store_dir, cls.TEXT_FILE)
+        if os.path.getsize(text_path) == 0:
+            store._text_buf = b""
+        else:
+            with open(text_path, 'rb') as f:
+                store._text_buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        return store
+    
+    @property
+    def texts(self) -> List[str]:
+        """All chunk texts (decoded from the buffer on first use after load())."""
+        if self._texts is None:
+            self._texts = [self._get_text(i) for i in range(len(self))]
+        return self._texts
+    
+    @property
+    def citations(self) -> List[str]:
+        """Citation of every chunk, formatted once on first use."""
+        if self._citations is None:
+            self._citations = [
+                f"[p{page}:c{chunk_id}]"
+                for page, chunk_id in zip(self.page_numbers.tolist(), self.chunk_ids.tolist())
+            ]
+        return self._citations
+    
+    def _get_text(self, index: int) -> str:
+        if self._texts is not None:
+            return self._texts[index]
+        start = int(self._text_offsets[index])
+        end = int(self._text_offsets[index + 1])
+        return self._text_buf[start:end].decode("utf-8")
+    
+    def __len__(self) -> int:
+        return len(self.page_numbers)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return PDFChunk(
+            text=self._get_text(index),
+            page_number=int(self.page_numbers[index]),
+            chunk_id=int(self.chunk_ids[index])
+        )
+    
+    def view(self, index: int) -> ChunkView:
+        """
+        Return a lazy view of one chunk without copying its text.
+        
+        Args:
+            index: Position of the chunk in the store
+            
+        Returns:
+            ChunkView reading from this store
+        """
+        if index < 0:
+            index += len(self)
+        return ChunkView(self, index)
+    
+    def __iter__(self) -> Iterator[PDFChunk]:
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __repr__(self):
+        return f"ChunkStore(chunks={len(self)})"
 
 
 class PDFIngestor:
@@ -33,37 +365,90 @@ class PDFIngestor:
         Args:
             chunk_size: Target size of each chunk in characters (~500 tokens)
             chunk_overlap: Number of overlapping characters (~100 tokens)
+            
+        Raises:
+            ValueError: If chunk_overlap is negative or not smaller than chunk_size
         """
+        # Chunking advances by chunk_size - chunk_overlap, which must be positive
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(
+                f"chunk_overlap must be >= 0 and smaller than chunk_size "
+                f"(got chunk_size={chunk_size}, chunk_overlap={chunk_overlap})"
+            )
+        
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         
-    def extract_text_from_pdf(self, pdf_path: str) -> List[Dict[str, any]]:
+    def iter_pages(self, pdf_path: str) -> Iterator[Dict[str, any]]:
         """
-        Extract text from PDF page by page.
+        Extract text from PDF page by page, yielding each page as it is read.
         
         Args:
             pdf_path: Path to the PDF file
             
-        Returns:
-            List of dictionaries with page_number and text
+        Yields:
+            Dictionaries with page_number and text (pages without text are skipped)
         """
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
         
-        reader = PdfReader(pdf_path)
-        pages = []
+        reader = PdfReader(pdf_path, strict=False)
+        num_pages = len(reader.pages)
+        workers = os.cpu_count() or 1
+        pages_with_text = 0
+        
+        print(f"Extracting text from {num_pages} pages...")
+        if num_pages >= PARALLEL_MIN_PAGES and workers > 1:
+            # Page extraction is CPU-bound pure Python; spread it across processes
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_page_worker,
+                initargs=(pdf_path,)
+            )
+            results = executor.map(
+                _extract_one_page,
+                range(1, num_pages + 1),
+                chunksize=max(1, num_pages // (workers * 4))
+            )
+        else:
+            executor = None
+            results = (
+                (page_num, page.extract_text() or "")
+                for page_num, page in enumerate(reader.pages, start=1)
+            )
+        
+        try:
+            # executor.map preserves order, so pages arrive sorted by page number
+            for page_num, text in tqdm(results, total=num_pages, desc="Reading PDF"):
+                if text and not text.isspace():
+                    pages_with_text += 1
+                    yield {
+                        'page_number': page_num,
+                        'text': text
+                    }
+        finally:
+            if executor is not None:
+                # If the caller stopped early, drop the pages not yet extracted
+                # instead of waiting for them
+                if sys.version_info >= (3, 9):
+                    executor.shutdown(cancel_futures=True)
+                else:
+                    results.close()  # map() cancels its pending futures on close
+                    executor.shutdown()
         
-        print(f"Extracting text from {len(reader.pages)} pages...")
-        for page_num, page in enumerate(tqdm(reader.pages, desc="Reading PDF"), start=1):
-            text = page.extract_text()
-            if text and text.strip():
-                pages.append({
-                    'page_number': page_num,
-                    'text': text
-                })
+        print(f"Successfully extracted {pages_with_text} pages with text.")
+    
+    def extract_text_from_pdf(self, pdf_path: str) -> List[Dict[str, any]]:
+        """
+        Extract text from PDF page by page.
         
-        print(f"Successfully extracted {len(pages)} pages with text.")
-        return pages
+        Args:
+            pdf_path: Path to the PDF file
+            
+        Returns:
+            List of dictionaries with page_number and text
+        """
+        return list(self.iter_pages(pdf_path))
     
     def chunk_text(self, text: str, page_number: int, start_chunk_id: int) -> List[PDFChunk]:
         """
@@ -77,29 +462,35 @@ class PDFIngestor:
         Returns:
             List of PDFChunk objects
         """
+        # Short page: a single chunk, no offset computation needed
+        if len(text) <= self.chunk_size:
+            text = text.strip()
+            if not text:
+                return []
+            return [PDFChunk(text=text, page_number=page_number, chunk_id=start_chunk_id)]
+        
         chunks = []
         chunk_id = start_chunk_id
-        start = 0
         
-        while start < len(text):
-            end = start + self.chunk_size
-            chunk_text = text[start:end]
+        # Offsets advance by (chunk_size - overlap), snapped to whitespace
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        starts, ends = _chunk_offsets(codes, self.chunk_size, self.chunk_overlap)
+        
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            chunk_text = text[start:end].strip()
             
             # Only add non-empty chunks
-            if chunk_text.strip():
+            if chunk_text:
                 chunks.append(PDFChunk(
-                    text=chunk_text.strip(),
+                    text=chunk_text,
                     page_number=page_number,
                     chunk_id=chunk_id
                 ))
                 chunk_id += 1
-            
-            # Move forward by (chunk_size - overlap)
-            start += (self.chunk_size - self.chunk_overlap)
         
         return chunks
     
-    def ingest_pdf(self, pdf_path: str) -> List[PDFChunk]:
+    def ingest_pdf(self, pdf_path: str) -> ChunkStore:
         """
         Complete ingestion pipeline: extract pages and chunk text.
         
@@ -107,30 +498,35 @@ class PDFIngestor:
             pdf_path: Path to the PDF file
             
         Returns:
-            List of all PDFChunk objects
+            ChunkStore holding all chunks
         """
-        pages = self.extract_text_from_pdf(pdf_path)
-        
-        all_chunks = []
+        texts = []
+        page_numbers = []
+        chunk_ids = []
         chunk_id = 0
+        num_pages = 0
         
-        print("Chunking text with overlap...")
-        for page_data in tqdm(pages, desc="Chunking"):
+        # Chunk each page as soon as it is extracted; only one page of raw
+        # text is held at a time
+        for page_data in self.iter_pages(pdf_path):
             page_chunks = self.chunk_text(
                 text=page_data['text'],
                 page_number=page_data['page_number'],
                 start_chunk_id=chunk_id
             )
-            all_chunks.extend(page_chunks)
+            for chunk in page_chunks:
+                texts.append(chunk.text)
+                page_numbers.append(chunk.page_number)
+                chunk_ids.append(chunk.chunk_id)
             chunk_id += len(page_chunks)
+            num_pages += 1
         
-        print(f"Created {len(all_chunks)} chunks from {len(pages)} pages.")
-        return all_chunks
+        print(f"Created {len(texts)} chunks from {num_pages} pages.")
+        return ChunkStore(texts, page_numbers, chunk_ids)
 
 
 if __name__ == "__main__":
     # Test the ingestor
-    import sys
     if len(sys.argv) > 1:
         ingestor = PDFIngestor()
         chunks = ingestor.ingest_pdf(sys.argv[1])
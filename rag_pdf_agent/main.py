@@ -69,6 +69,22 @@ Environment Variables:
     #     help="Disable retrieval debug output"
     # )
     
+    parser.add_argument(
+        "--embedding-backend",
+        type=str,
+        default="torch",
+        choices=["torch", "onnx"],
+        help="Embedding inference backend; onnx uses an int8 ONNX Runtime export (default: torch)"
+    )
+    
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=None,
+        help="Answer 'Not found' without calling Gemini when the best chunk's similarity "
+             "is below this value (default: tuned per embedding model)"
+    )
+    
     parser.add_argument(
         "--use-cache",
         action="store_true",
@@ -87,6 +103,10 @@ Environment Variables:
         print(f"Error: File must be a PDF document: {pdf_path}")
         sys.exit(1)
     
+    if not 0 <= args.chunk_overlap < args.chunk_size:
+        print("Error: --chunk-overlap must be >= 0 and smaller than --chunk-size")
+        sys.exit(1)
+    
     # Check for API key (now optional - will run in fallback mode if not available)
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
@@ -118,14 +138,12 @@ Environment Variables:
     # Check if we can use cached index
     use_existing_index = False
     if args.use_cache and index_dir.exists():
-        faiss_path = index_dir / "faiss.index"
-        chunks_path = index_dir / "chunks.pkl"
-        if faiss_path.exists() and chunks_path.exists():
+        if VectorRetriever.has_saved_index(str(index_dir)):
             use_existing_index = True
             print(f"\n✓ Using cached index from: {index_dir}")
     
     # Initialize retriever
-    retriever = VectorRetriever()
+    retriever = VectorRetriever(backend=args.embedding_backend, min_score=args.min_score)
     
     if use_existing_index:
         # Load existing index
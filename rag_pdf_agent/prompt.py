@@ -1,6 +1,25 @@
 """
 Prompt templates for grounded RAG responses.
 """
+import functools
+import re
+from typing import Callable
+
+# Citation marker such as [p5:c12]
+_CITATION_RE = re.compile(r'\[p(\d+):c(\d+)\]')
+
+# Canned refusal the model is instructed to give; also returned directly when
+# retrieval finds nothing relevant enough to send to the model
+NOT_FOUND_RESPONSE = "Not found in the document."
+
+# Phrases that mark a response as a refusal, matched in a single pass
+_NOT_FOUND_RE = re.compile(
+    r"not found in the document"
+    r"|not mentioned in the document"
+    r"|does not contain"
+    r"|information is not available",
+    re.IGNORECASE
+)
 
 SYSTEM_INSTRUCTION = """You are a STRICTLY GROUNDED document assistant. You MUST answer ONLY from the retrieved document chunks provided below.
 
@@ -31,61 +50,93 @@ Respond EXACTLY: "Not found in the document."
 Do NOT deviate from this format or these rules under ANY circumstances."""
 
 
-def build_grounded_prompt(query: str, retrieved_chunks: list, conversation_history: list = None) -> str:
+# Constant instructions placed right after SYSTEM_INSTRUCTION. Keeping every
+# per-turn value (chunks, history, question) after this block means the prompt
+# prefix is byte-identical across turns and can be served from prefix caches.
+FORMAT_INSTRUCTIONS = """INSTRUCTIONS:
+Answer the CURRENT USER QUESTION using ONLY the information in the RETRIEVED DOCUMENT CHUNKS below.
+
+If the answer is not explicitly in the chunks, respond with EXACTLY:
+"Not found in the document."
+
+If you can answer:
+1. Provide a clear, concise answer
+2. Include citations using [pX:cY] format (where X is page number and Y is chunk ID)
+3. Include an "Evidence" section with relevant quotes"""
+
+
+# Layout of one retrieved chunk in the prompt; fields: citation, page, text
+_CHUNK_TEMPLATE = "[CHUNK {index}] {{}}\nPage {{}}\nText: {{}}\n"
+
+
+@functools.lru_cache(maxsize=64)
+def _make_prompt_template(num_chunks: int, history_len: int) -> Callable[..., str]:
     """
-    Build a prompt that grounds the answer in retrieved chunks.
+    Build the prompt layout for a fixed number of chunks and history turns.
+    
+    The layout is assembled once per (num_chunks, history_len) pair, so each
+    turn only fills positional fields with a single str.format call.
     
     Args:
-        query: User's current question
-        retrieved_chunks: List of (PDFChunk, score) tuples
-        conversation_history: List of previous (user_msg, assistant_msg) tuples
+        num_chunks: Number of retrieved chunks in the prompt
+        history_len: Number of (user_msg, assistant_msg) turns in the prompt
         
     Returns:
-        Formatted prompt string
+        Callable taking (citation, page, text) per chunk, (user_msg,
+        assistant_msg) per turn, then the query, and returning the prompt
     """
-    # Build context from retrieved chunks
-    context_parts = []
-    for i, (chunk, score) in enumerate(retrieved_chunks, 1):
-        citation = chunk.get_citation()
-        context_parts.append(
-            f"[CHUNK {i}] {citation}\n"
-            f"Page {chunk.page_number}\n"
-            f"Text: {chunk.text}\n"
-        )
+    def escape(text: str) -> str:
+        return text.replace("{", "{{").replace("}", "}}")
     
-    context = "\n---\n".join(context_parts)
+    context = "\n---\n".join(
+        _CHUNK_TEMPLATE.format(index=i) for i in range(1, num_chunks + 1)
+    )
     
-    # Build conversation context if history exists
     history_text = ""
-    if conversation_history:
-        history_parts = []
-        for user_msg, assistant_msg in conversation_history[-3:]:  # Last 3 turns
-            history_parts.append(f"User: {user_msg}")
-            history_parts.append(f"Assistant: {assistant_msg}")
-        history_text = "\n\nPREVIOUS CONVERSATION:\n" + "\n".join(history_parts)
+    if history_len:
+        history_text = (
+            "PREVIOUS CONVERSATION:\n"
+            + "\n".join(["User: {}\nAssistant: {}"] * history_len)
+            + "\n\n"
+        )
     
-    prompt = f"""RETRIEVED DOCUMENT CHUNKS:
-{context}
-
-{history_text}
-
-CURRENT USER QUESTION:
-{query}
-
-INSTRUCTIONS:
-Answer the question using ONLY the information in the retrieved chunks above. 
+    layout = (
+        escape(FORMAT_INSTRUCTIONS)
+        + "\n\nRETRIEVED DOCUMENT CHUNKS:\n"
+        + context
+        + "\n\n"
+        + history_text
+        + "CURRENT USER QUESTION:\n{}\n\nYour response:"
+    )
+    return layout.format
 
-If the answer is not explicitly in the chunks, respond with EXACTLY:
-"Not found in the document."
-
-If you can answer:
-1. Provide a clear, concise answer
-2. Include citations using [pX:cY] format (where X is page number and Y is chunk ID)
-3. Include an "Evidence" section with relevant quotes
 
-Your response:"""
+def build_grounded_prompt(query: str, retrieved_chunks: list, conversation_history: list = None) -> str:
+    """
+    Build a prompt that grounds the answer in retrieved chunks.
+    
+    Sections are emitted constant-first: FORMAT_INSTRUCTIONS, then retrieved
+    chunks, conversation history and finally the question.
+    
+    Args:
+        query: User's current question
+        retrieved_chunks: List of (chunk, score) tuples
+        conversation_history: List of previous (user_msg, assistant_msg) tuples
+        
+    Returns:
+        Formatted prompt string
+    """
+    history = conversation_history[-3:] if conversation_history else []  # Last 3 turns
+    fill = _make_prompt_template(len(retrieved_chunks), len(history))
+    
+    fields = []
+    for chunk, score in retrieved_chunks:
+        fields += (chunk.get_citation(), chunk.page_number, chunk.text)
+    for user_msg, assistant_msg in history:
+        fields += (user_msg, assistant_msg)
+    fields.append(query)
     
-    return prompt
+    return fill(*fields)
 
 
 def rewrite_query_with_history(query: str, conversation_history: list) -> str:
@@ -129,6 +180,27 @@ STANDALONE QUESTION:"""
     return rewrite_prompt
 
 
+def rewrite_query_locally(query: str, conversation_history: list) -> str:
+    """
+    Make a follow-up question standalone without an LLM call.
+    
+    Prepends the previous user question so that pronouns like "it" or
+    "they" are retrieved alongside the entity they refer to.
+    
+    Args:
+        query: Current user query (might be a follow-up)
+        conversation_history: List of previous (user_msg, assistant_msg) tuples
+        
+    Returns:
+        Standalone query string for retrieval
+    """
+    if not conversation_history:
+        return query
+    
+    last_user_msg = conversation_history[-1][0]
+    return f"{last_user_msg} {query}"
+
+
 # Response parsing helpers
 def parse_response_for_citations(response: str) -> list:
     """
@@ -140,10 +212,7 @@ def parse_response_for_citations(response: str) -> list:
     Returns:
         List of citation strings like ['p5:c12', 'p7:c25']
     """
-    import re
-    pattern = r'\[p(\d+):c(\d+)\]'
-    matches = re.findall(pattern, response)
-    return [f"p{page}:c{chunk}" for page, chunk in matches]
+    return [f"p{page}:c{chunk}" for page, chunk in _CITATION_RE.findall(response)]
 
 
 def is_not_found_response(response: str) -> bool:
@@ -156,11 +225,4 @@ def is_not_found_response(response: str) -> bool:
     Returns:
         True if response indicates not found
     """
-    response_lower = response.lower().strip()
-    not_found_phrases = [
-        "not found in the document",
-        "not mentioned in the document",
-        "does not contain",
-        "information is not available"
-    ]
-    return any(phrase in response_lower for phrase in not_found_phrases)
+    return _NOT_FOUND_RE.search(response) is not None
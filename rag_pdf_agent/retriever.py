@@ -2,64 +2,432 @@
 Vector retrieval module using FAISS.
 Builds index from chunks and performs similarity search.
 """
+import hashlib
+import inspect
+import json
 import os
 import pickle
-from typing import List, Tuple
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
 import numpy as np
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
-from ingest import PDFChunk
+from tqdm import tqdm
+from encoder import FastQueryEncoder, available_cpus
+from ingest import PDFChunk, ChunkLike, ChunkStore
+
+# Texts per forward pass when embedding chunks in build_index
+EMBED_BATCH_SIZE = 64
+
+# Chunks embedded per shard in build_index; each shard is added to the
+# index on a worker thread while the next one is encoded
+BUILD_SHARD_SIZE = 8192
+
+# Vectors that IVF / SQ8 indexes are trained on (the first ones encoded);
+# the rest of the corpus is added shard by shard after training
+TRAIN_SAMPLE_SIZE = 100_000
+
+# Saved index files: float16 embeddings (+ metadata) for exact indexes,
+# FAISS binary format for IVF/HNSW
+EMBEDDINGS_FILE = "embeddings.fp16.npy"
+EMBEDDINGS_META_FILE = "meta.json"
+FAISS_INDEX_FILE = "faiss.index"
+
+# Pickled chunk list written by older versions; converted on first load
+LEGACY_CHUNKS_FILE = "chunks.pkl"
+
+# Rows upcast to float32 at a time while loading float16 embeddings
+FP16_LOAD_BLOCK = 4096
+
+# Query embeddings kept in the exact-match cache
+EMBEDDING_CACHE_SIZE = 1024
+
+# Searched queries kept in the semantic (near-duplicate) cache
+SEMANTIC_CACHE_SIZE = 512
+
+# Corpus sizes at which build_index switches from exact search to IVF, then HNSW
+IVF_MIN_VECTORS = 10_000
+HNSW_MIN_VECTORS = 1_000_000
+
+# Corpus size from which IVF/HNSW store 8-bit scalar-quantized vectors
+SQ8_MIN_VECTORS = 50_000
+
+# Top-1 cosine similarity below which a query is treated as off-topic and
+# gets no results. Scores are only comparable within one embedding model, so
+# thresholds are per model; models not listed here never drop results.
+MIN_SCORE_BY_MODEL = {
+    "sentence-transformers/all-mpnet-base-v2": 0.25,
+}
+
+# Where ONNX exports of embedding models are cached (backend="onnx")
+ONNX_CACHE_DIR = os.path.join("data", "onnx")
+
+
+def _configure_cpu_threads() -> None:
+    """
+    Size PyTorch's thread pools to the CPUs this process may run on.
+    
+    PyTorch defaults to the host's core count, which oversubscribes
+    containers and affinity-restricted processes.
+    """
+    torch.set_num_threads(available_cpus())
+    
+    try:
+        # Encoding parallelizes within ops; inter-op threads mostly sit idle
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        pass  # Can only be set before PyTorch's first parallel op
 
 
 class VectorRetriever:
     """Handles vector embedding and similarity search."""
     
-    def __init__(self, model_name: str = "sentence-transformers/all-mpnet-base-v2"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        backend: str = "torch",
+        precision: str = "auto",
+        semantic_cache_threshold: float = 0.97,
+        min_score: Optional[float] = None,
+        verbose: bool = True
+    ):
         """
         Initialize the retriever with an embedding model.
         
         Args:
             model_name: Name of the sentence-transformers model to use
+            backend: "torch" to encode with sentence-transformers, or "onnx" to
+                encode with an int8-quantized ONNX Runtime export (CPU, faster;
+                requires onnxruntime)
+            precision: Torch backend weight precision: "fp32", "fp16", "bf16",
+                or "auto" (fp16 on CUDA, fp32 on CPU). bf16 only pays off on
+                CPUs with native bf16 support (AVX512-BF16 / AMX)
+            semantic_cache_threshold: Cosine similarity above which a new query
+                reuses the search results of a previously seen query (set
+                above 1.0 to disable)
+            min_score: Return no results when the best match scores below
+                this cosine similarity (None: MIN_SCORE_BY_MODEL entry for
+                model_name, else no threshold)
+            verbose: Whether to print status messages (model loading, index
+                build/save/load progress)
         """
-        print(f"Loading embedding model: {model_name}")
-        self.embedding_model = SentenceTransformer(model_name)
+        self.verbose = verbose
+        
+        if min_score is None:
+            min_score = MIN_SCORE_BY_MODEL.get(model_name, float("-inf"))
+        self.min_score = min_score
+        
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        if precision not in ("auto", "fp32", "fp16", "bf16"):
+            raise ValueError(f"Unknown embedding precision: {precision}")
+        
+        if not torch.cuda.is_available():
+            _configure_cpu_threads()
+        
+        self._status(f"Loading embedding model: {model_name}")
+        # The ONNX backend exports and runs on the CPU; keep the torch model
+        # there too rather than parking an unused copy on the GPU
+        device = "cpu" if backend == "onnx" else None
+        self.embedding_model = SentenceTransformer(model_name, device=device)
+        
+        if precision == "auto":
+            precision = "fp16" if self.embedding_model.device.type == "cuda" else "fp32"
+        if backend == "torch" and precision == "fp16":
+            self.embedding_model.half()
+        elif backend == "torch" and precision == "bf16":
+            self.embedding_model.to(torch.bfloat16)
+        
+        if backend == "onnx":
+            from encoder import OnnxEncoder
+            export_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "_"))
+            self.embedding_model = OnnxEncoder(self.embedding_model, export_dir, verbose=self.verbose)
+        
+        # Queries are short and few, so skip encode()'s batching machinery
+        # when the model allows it (the ONNX encoder is already lean)
+        self._query_encoder = self.embedding_model
+        if backend == "torch" and FastQueryEncoder.supports(self.embedding_model):
+            self._query_encoder = FastQueryEncoder(self.embedding_model)
+        
         self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
         
         self.index = None
         self.chunks = []
         
-    def build_index(self, chunks: List[PDFChunk]) -> None:
+        # Incremented whenever the index is replaced, so callers holding
+        # search results (e.g. RAGChatAgent's query cache) can tell they are stale
+        self.index_version = 0
+        self._gpu_resources = None
+        
+        # Exact-match query embedding cache: blake2b(query) -> embedding
+        self._emb_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        
+        # Semantic cache: embeddings of searched queries and their (top_k, results)
+        self.semantic_cache_threshold = semantic_cache_threshold
+        self._semantic_index = faiss.IndexFlatIP(self.embedding_dim)
+        self._semantic_results: deque = deque()
+        
+    def build_index(self, chunks: Union[ChunkStore, List[PDFChunk]]) -> None:
         """
         Build FAISS index from PDF chunks.
         
+        Embedding and index construction are pipelined: each shard of
+        embeddings is normalized and added on a worker thread while the
+        next shard is encoded.
+        
         Args:
-            chunks: List of PDFChunk objects to index
+            chunks: ChunkStore (or list of PDFChunk objects) to index
         """
         if not chunks:
             raise ValueError("Cannot build index from empty chunks list")
         
+        if not isinstance(chunks, ChunkStore):
+            chunks = ChunkStore.from_chunks(chunks)
         self.chunks = chunks
         
-        # Generate embeddings
-        print(f"Generating embeddings for {len(chunks)} chunks...")
-        texts = [chunk.text for chunk in chunks]
-        embeddings = self.embedding_model.encode(
-            texts, 
-            show_progress_bar=True,
-            convert_to_numpy=True
+        # Generate embeddings and build FAISS index
+        self._status(f"Generating embeddings and building FAISS index for {len(chunks)} chunks...")
+        index = self._create_index(len(chunks))
+        self._add_embeddings(index, self._iter_embedding_shards(chunks.texts))
+        self.index = self._to_gpu(index)
+        self._index_replaced()
+        
+        self._status(f"Index built successfully with {self.index.ntotal} vectors.")
+    
+    def _create_index(self, n: int) -> faiss.Index:
+        """
+        Create an empty FAISS index sized for the corpus.
+        
+        Small corpora use exact search; larger ones use IVF or HNSW, which
+        trade a little recall for sub-linear search time. Large corpora also
+        store vectors as 8-bit scalar-quantized codes (4x less memory and
+        bandwidth than float32). All indexes use inner product, which equals
+        cosine similarity on normalized vectors.
+        
+        Args:
+            n: Number of vectors that will be added
+            
+        Returns:
+            FAISS index (IVF and SQ8 indexes still need training before add())
+        """
+        if n < IVF_MIN_VECTORS:
+            return faiss.IndexFlatIP(self.embedding_dim)
+        
+        storage = "SQ8" if n >= SQ8_MIN_VECTORS else "Flat"
+        
+        if n < HNSW_MIN_VECTORS:
+            nlist = int(4 * np.sqrt(n))
+            index = faiss.index_factory(self.embedding_dim, f"IVF{nlist},{storage}", faiss.METRIC_INNER_PRODUCT)
+            index.nprobe = max(8, nlist // 32)
+            return index
+        
+        index = faiss.index_factory(self.embedding_dim, f"HNSW32,{storage}", faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+        return index
+    
+    def _add_embeddings(self, index: faiss.Index, shards: Iterator[np.ndarray]) -> None:
+        """
+        Normalize embedding shards and add them to the index.
+        
+        Each shard is handed to a worker thread, so normalizing and adding
+        it overlaps with encoding the next one (FAISS and torch both release
+        the GIL). Indexes that need training (IVF, SQ8) hold shards back
+        until TRAIN_SAMPLE_SIZE vectors (or the whole corpus, if smaller)
+        have arrived, train on them, and then add the rest shard by shard.
+        
+        Args:
+            index: Index from _create_index()
+            shards: Float32 embeddings in chunk order, shard by shard
+        """
+        held_back: List[np.ndarray] = []
+        held_rows = 0
+        
+        def train_and_add_held_back() -> None:
+            nonlocal held_rows
+            sample = held_back[0] if len(held_back) == 1 else np.concatenate(held_back)
+            self._status(f"Training {type(index).__name__} on {min(len(sample), TRAIN_SAMPLE_SIZE)} vectors...")
+            index.train(sample[:TRAIN_SAMPLE_SIZE])
+            index.add(sample)
+            held_back.clear()
+            held_rows = 0
+        
+        def consume(embeddings: np.ndarray) -> None:
+            nonlocal held_rows
+            faiss.normalize_L2(embeddings)
+            if index.is_trained:
+                index.add(embeddings)
+                return
+            held_back.append(embeddings)
+            held_rows += len(embeddings)
+            if held_rows >= TRAIN_SAMPLE_SIZE:
+                train_and_add_held_back()
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = None
+            for embeddings in shards:
+                if pending is not None:
+                    pending.result()
+                pending = executor.submit(consume, embeddings)
+            if pending is not None:
+                pending.result()
+        
+        # Corpus smaller than the training sample
+        if held_back:
+            train_and_add_held_back()
+    
+    def _status(self, message: str) -> None:
+        """Print a status message unless the retriever was created with verbose=False."""
+        if self.verbose:
+            print(message)
+    
+    def _to_gpu(self, index: faiss.Index) -> faiss.Index:
+        """
+        Move an index to the first GPU when a GPU build of FAISS can use one.
+        
+        Only flat and IVF-flat indexes have GPU implementations; others
+        (HNSW, scalar-quantized) stay on the CPU.
+        
+        Args:
+            index: CPU index
+            
+        Returns:
+            GPU copy of the index, or the index itself
+        """
+        if faiss.get_num_gpus() == 0 or not isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat)):
+            return index
+        
+        # The resources object must outlive every GPU index created from it
+        if self._gpu_resources is None:
+            self._gpu_resources = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
+    
+    def _iter_embedding_shards(self, texts: List[str]) -> Iterator[np.ndarray]:
+        """
+        Embed texts shard by shard, in input order.
+        
+        Args:
+            texts: Texts to embed
+            
+        Yields:
+            Float32 arrays of up to BUILD_SHARD_SIZE embeddings
+        """
+        # A worker pool is expensive to start, so it gets the whole corpus
+        devices = self._multi_process_devices()
+        if devices:
+            yield self._encode_multi_process(texts, devices)
+            return
+        
+        with tqdm(total=len(texts), desc="Embedding") as progress:
+            for start in range(0, len(texts), BUILD_SHARD_SIZE):
+                yield self._encode_length_sorted(texts[start:start + BUILD_SHARD_SIZE], progress)
+    
+    def _length_order(self, texts: List[str]) -> np.ndarray:
+        """Indices that sort texts by token length (stable)."""
+        tokenized = self.embedding_model.tokenizer(
+            texts,
+            truncation=True,
+            max_length=self.embedding_model.max_seq_length
         )
+        lengths = [len(ids) for ids in tokenized["input_ids"]]
+        return np.argsort(lengths, kind="stable")
+    
+    def _encode_length_sorted(self, texts: List[str], progress: tqdm) -> np.ndarray:
+        """
+        Embed texts in batches of similar token length.
         
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(embeddings)
+        Transformer batches are padded to their longest sequence, so grouping
+        texts of similar length cuts the padding tokens processed.
         
-        # Build FAISS index
-        print("Building FAISS index...")
-        self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner product for cosine similarity
-        self.index.add(embeddings)
+        Args:
+            texts: Texts to embed
+            progress: Progress bar, advanced per embedded text
+            
+        Returns:
+            Float32 array of shape (len(texts), embedding_dim), in input order
+        """
+        order = self._length_order(texts)
+        embeddings = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = order[start:start + EMBED_BATCH_SIZE]
+            # Writing rows back by index restores the original order (and casts
+            # fp16/bf16 model output to the float32 FAISS expects)
+            with torch.inference_mode():
+                embeddings[batch] = self.embedding_model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True
+                )
+            progress.update(len(batch))
+        
+        return embeddings
+    
+    def _encode_multi_process(self, texts: List[str], devices: List[str]) -> np.ndarray:
+        """
+        Embed texts with one worker process per device.
+        
+        Args:
+            texts: Texts to embed
+            devices: Device of each worker, from _multi_process_devices()
+            
+        Returns:
+            Float32 array of shape (len(texts), embedding_dim), in input order
+        """
+        self._status(f"Encoding with {len(devices)} worker processes ({', '.join(devices)})...")
+        order = self._length_order(texts)
+        embeddings = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        
+        pool = self.embedding_model.start_multi_process_pool(target_devices=devices)
+        try:
+            # Workers receive consecutive slices of the length-sorted texts.
+            # sentence-transformers 5+ takes the pool in encode() and
+            # deprecates encode_multi_process()
+            sorted_texts = [texts[i] for i in order]
+            if "pool" in inspect.signature(self.embedding_model.encode).parameters:
+                embeddings[order] = self.embedding_model.encode(
+                    sorted_texts,
+                    pool=pool,
+                    batch_size=EMBED_BATCH_SIZE,
+                    convert_to_numpy=True
+                )
+            else:
+                embeddings[order] = self.embedding_model.encode_multi_process(
+                    sorted_texts,
+                    pool,
+                    batch_size=EMBED_BATCH_SIZE
+                )
+        finally:
+            self.embedding_model.stop_multi_process_pool(pool)
         
-        print(f"Index built successfully with {self.index.ntotal} vectors.")
+        return embeddings
     
-    def retrieve(self, query: str, top_k: int = 5) -> List[Tuple[PDFChunk, float]]:
+    def _multi_process_devices(self) -> List[str]:
+        """
+        Pick the devices to shard corpus encoding across.
+        
+        Only multiple GPUs are worth a worker pool. On CPU, a single process
+        already spreads each forward pass over every core (see
+        _configure_cpu_threads), and extra processes would just compete for
+        the same cores.
+        
+        Returns:
+            One device name per worker, or an empty list to encode in-process
+        """
+        # The ONNX backend has no multi-process pool
+        if not isinstance(self.embedding_model, SentenceTransformer):
+            return []
+        
+        num_gpus = torch.cuda.device_count()
+        if num_gpus > 1:
+            return [f"cuda:{i}" for i in range(num_gpus)]
+        
+        return []
+    
+    def retrieve(self, query: str, top_k: int = 5) -> List[Tuple[ChunkLike, float]]:
         """
         Retrieve top-k most similar chunks for a query.
         
@@ -68,48 +436,252 @@ class VectorRetriever:
             top_k: Number of chunks to retrieve
             
         Returns:
-            List of (PDFChunk, similarity_score) tuples
+            List of (chunk, similarity_score) tuples; empty if even the
+            best match scores below min_score
         """
         if self.index is None:
             raise RuntimeError("Index not built. Call build_index() first.")
         
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(
-            [query], 
-            convert_to_numpy=True
-        )
-        faiss.normalize_L2(query_embedding)
+        query_embedding = self.encode_query(query)
+        return self.search_embedding(query_embedding, top_k=top_k)
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query string for similarity search.
+        
+        Args:
+            query: User query string
+            
+        Returns:
+            L2-normalized float32 array of shape (1, embedding_dim)
+        """
+        return self.encode_queries([query])
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed several query strings in one encode call.
+        
+        Previously seen queries are served from an LRU cache; only the
+        remaining ones go through the embedding model.
+        
+        Args:
+            queries: Query strings
+            
+        Returns:
+            L2-normalized float32 array of shape (len(queries), embedding_dim)
+        """
+        keys = [hashlib.blake2b(query.encode("utf-8"), digest_size=16).digest() for query in queries]
+        
+        missing = []
+        hits = []
+        for i, key in enumerate(keys):
+            cached = self._emb_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                self._emb_cache.move_to_end(key)
+                hits.append((i, cached))
+        
+        encoded = None
+        if missing:
+            with torch.inference_mode():
+                encoded = self._query_encoder.encode(
+                    [queries[i] for i in missing],
+                    batch_size=len(missing),
+                    convert_to_numpy=True
+                )
+            # FAISS needs float32 even when the model runs in fp16/bf16;
+            # normalize in place rather than into a fresh buffer
+            encoded = np.ascontiguousarray(encoded, dtype=np.float32)
+            faiss.normalize_L2(encoded)
+            
+            for i, embedding in zip(missing, encoded):
+                self._emb_cache[keys[i]] = embedding.copy()
+                if len(self._emb_cache) > EMBEDDING_CACHE_SIZE:
+                    self._emb_cache.popitem(last=False)
+        
+        # All cache misses (the usual single-query case): the encoder output
+        # already is the query matrix, so skip assembling a second one
+        if missing and not hits:
+            return encoded
+        
+        query_embeddings = np.empty((len(queries), self.embedding_dim), dtype=np.float32)
+        for i, cached in hits:
+            query_embeddings[i] = cached
+        if missing:
+            query_embeddings[missing] = encoded
+        
+        return query_embeddings
+    
+    def search_embedding(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[ChunkLike, float]]:
+        """
+        Retrieve top-k chunks for an already-encoded query.
+        
+        Queries within semantic_cache_threshold of a recently searched query
+        reuse that query's results without searching the index.
+        
+        Args:
+            query_embedding: Normalized query embedding from encode_query()
+            top_k: Number of chunks to retrieve
+            
+        Returns:
+            List of (chunk, similarity_score) tuples
+        """
+        if self.index is None:
+            raise RuntimeError("Index not built. Call build_index() first.")
+        
+        # Near-duplicate of a recent query: reuse its results, skip the search
+        if self._semantic_index.ntotal:
+            sims, ids = self._semantic_index.search(query_embedding, 1)
+            if sims[0][0] > self.semantic_cache_threshold:
+                cached_k, cached_results = self._semantic_results[ids[0][0]]
+                if cached_k >= top_k:
+                    return cached_results[:top_k]
         
         # Search
         scores, indices = self.index.search(query_embedding, top_k)
+        results = self._collect_results(indices[0], scores[0])
         
-        # Return chunks with scores
-        results = []
-        for idx, score in zip(indices[0], scores[0]):
-            if idx < len(self.chunks):
-                results.append((self.chunks[idx], float(score)))
+        # FIFO eviction keeps row i of the cache index aligned with entry i
+        if self._semantic_index.ntotal >= SEMANTIC_CACHE_SIZE:
+            self._semantic_index.remove_ids(np.array([0], dtype=np.int64))
+            self._semantic_results.popleft()
+        self._semantic_index.add(query_embedding)
+        self._semantic_results.append((top_k, results))
         
         return results
     
+    def _index_replaced(self) -> None:
+        """Invalidate search results that refer to the previous index."""
+        self.index_version += 1
+        self._clear_semantic_cache()
+    
+    def _clear_semantic_cache(self) -> None:
+        """Drop cached search results (they refer to the current index)."""
+        self._semantic_index.reset()
+        self._semantic_results.clear()
+    
+    def clear_caches(self) -> None:
+        """Drop cached query embeddings and search results."""
+        self._emb_cache.clear()
+        self._clear_semantic_cache()
+    
+    def retrieve_batch(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[ChunkLike, float]]]:
+        """
+        Retrieve top-k chunks for several queries at once.
+        
+        All queries are embedded in one encode call and searched with a
+        single FAISS search over the combined query matrix.
+        
+        Args:
+            queries: User query strings
+            top_k: Number of chunks to retrieve per query
+            
+        Returns:
+            One list of (chunk, similarity_score) tuples per query
+        """
+        if self.index is None:
+            raise RuntimeError("Index not built. Call build_index() first.")
+        
+        if not queries:
+            return []
+        
+        query_embeddings = self.encode_queries(queries)
+        
+        scores, indices = self.index.search(query_embeddings, top_k)
+        
+        return [
+            self._collect_results(row_indices, row_scores)
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+    
+    def _collect_results(self, indices: np.ndarray, scores: np.ndarray) -> List[Tuple[ChunkLike, float]]:
+        """
+        Turn one row of FAISS search output into (ChunkView, score) tuples.
+        
+        Args:
+            indices: Chunk indices returned by the search
+            scores: Matching similarity scores
+            
+        Returns:
+            List of (chunk, similarity_score) tuples
+        """
+        # Off-topic query: even the best match is too dissimilar to be useful
+        if not len(scores) or scores[0] < self.min_score:
+            return []
+        
+        # -1 marks "fewer than top_k hits"; .tolist() converts to Python
+        # ints/floats in one call instead of boxing each NumPy scalar.
+        # Views read from the chunk columns instead of copying each chunk.
+        valid = indices >= 0
+        return [
+            (self.chunks.view(idx), score)
+            for idx, score in zip(indices[valid].tolist(), scores[valid].tolist())
+        ]
+    
+    @staticmethod
+    def has_saved_index(index_dir: str) -> bool:
+        """
+        Check whether index_dir holds an index saved by save_index().
+        
+        Args:
+            index_dir: Directory to check
+            
+        Returns:
+            True if both vectors and chunks are present
+        """
+        path = Path(index_dir)
+        has_vectors = (
+            (path / EMBEDDINGS_FILE).is_file() and (path / EMBEDDINGS_META_FILE).is_file()
+        ) or (path / FAISS_INDEX_FILE).is_file()
+        has_chunks = ChunkStore.exists(index_dir) or (path / LEGACY_CHUNKS_FILE).is_file()
+        return has_vectors and has_chunks
+    
     def save_index(self, index_dir: str) -> None:
         """
         Save the FAISS index and chunks to disk.
         
+        Exact (flat) indexes are stored as a float16 embeddings matrix that
+        load_index memory-maps; IVF/HNSW indexes are written with FAISS.
+        
         Args:
             index_dir: Directory to save index files
         """
-        os.makedirs(index_dir, exist_ok=True)
+        path = Path(index_dir)
+        path.mkdir(parents=True, exist_ok=True)
         
-        # Save FAISS index
-        index_path = os.path.join(index_dir, "faiss.index")
-        faiss.write_index(self.index, index_path)
+        # GPU indexes must be copied back to be serialized
+        index = self.index
+        if hasattr(faiss, "GpuIndex") and isinstance(index, faiss.GpuIndex):
+            index = faiss.index_gpu_to_cpu(index)
         
-        # Save chunks
-        chunks_path = os.path.join(index_dir, "chunks.pkl")
-        with open(chunks_path, 'wb') as f:
-            pickle.dump(self.chunks, f)
+        embeddings_path = path / EMBEDDINGS_FILE
+        meta_path = path / EMBEDDINGS_META_FILE
+        index_path = path / FAISS_INDEX_FILE
         
-        print(f"Index saved to {index_dir}")
+        is_fp16 = (
+            isinstance(index, faiss.IndexScalarQuantizer)
+            and index.sq.qtype == faiss.ScalarQuantizer.QT_fp16
+        )
+        if (isinstance(index, faiss.IndexFlat) or is_fp16) and index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            vectors = index.reconstruct_n(0, index.ntotal).astype(np.float16)
+            np.save(embeddings_path, vectors)
+            meta = {"n": int(vectors.shape[0]), "d": int(vectors.shape[1]), "dtype": "float16"}
+            meta_path.write_text(json.dumps(meta))
+            stale_paths = [index_path]
+        else:
+            faiss.write_index(index, str(index_path))
+            stale_paths = [embeddings_path, meta_path]
+        
+        # Don't leave files from a previous save in the other format behind
+        for stale_path in stale_paths:
+            stale_path.unlink(missing_ok=True)
+        
+        # Save chunks as memory-mappable flat files
+        self.chunks.save(index_dir)
+        (path / LEGACY_CHUNKS_FILE).unlink(missing_ok=True)
+        
+        self._status(f"Index saved to {index_dir}")
     
     def load_index(self, index_dir: str) -> None:
         """
@@ -117,44 +689,127 @@ class VectorRetriever:
         
         Args:
             index_dir: Directory containing index files
+            
+        Raises:
+            FileNotFoundError: If index_dir holds no readable index
         """
-        # Load FAISS index
-        index_path = os.path.join(index_dir, "faiss.index")
-        if not os.path.exists(index_path):
-            raise FileNotFoundError(f"Index not found at {index_path}")
+        path = Path(index_dir)
+        
+        # Try each format by opening it; a missing file raises, so no
+        # separate existence checks are needed
+        try:
+            index = self._load_fp16_embeddings(path / EMBEDDINGS_FILE, path / EMBEDDINGS_META_FILE)
+        except FileNotFoundError:
+            try:
+                index = faiss.read_index(str(path / FAISS_INDEX_FILE))
+            except RuntimeError as e:
+                # FAISS reports unreadable files as a generic RuntimeError
+                raise FileNotFoundError(f"Index not found at {index_dir}: {e}") from e
         
-        self.index = faiss.read_index(index_path)
+        self.index = self._to_gpu(index)
+        self._index_replaced()
         
-        # Load chunks
-        chunks_path = os.path.join(index_dir, "chunks.pkl")
-        with open(chunks_path, 'rb') as f:
-            self.chunks = pickle.load(f)
+        # Load chunks; indexes saved by older versions only have chunks.pkl
+        if ChunkStore.exists(index_dir):
+            self.chunks = ChunkStore.load(index_dir)
+        else:
+            self.chunks = self._load_pickled_chunks(path)
         
-        print(f"Index loaded from {index_dir} ({len(self.chunks)} chunks)")
+        self._status(f"Index loaded from {index_dir} ({len(self.chunks)} chunks)")
     
-    def print_retrieval_debug(self, query: str, results: List[Tuple[PDFChunk, float]]) -> None:
+    def _load_pickled_chunks(self, index_dir: Path) -> ChunkStore:
+        """
+        Load a legacy chunks.pkl and, where the directory is writable, also
+        write it out as ChunkStore files so later loads can memory-map the
+        chunks instead of unpickling them. chunks.pkl itself is left in
+        place; save_index removes it.
+        
+        Args:
+            index_dir: Directory containing chunks.pkl
+            
+        Returns:
+            The loaded chunks
+        """
+        chunks_path = index_dir / LEGACY_CHUNKS_FILE
+        with chunks_path.open('rb') as f:
+            chunks = pickle.load(f)
+        
+        # chunks.pkl holds either a ChunkStore or a plain list of PDFChunk
+        if not isinstance(chunks, ChunkStore):
+            chunks = ChunkStore.from_chunks(chunks)
+        
+        try:
+            chunks.save(str(index_dir))
+        except OSError:
+            # Read-only or shared index directory: use the chunks in memory
+            return chunks
+        
+        self._status(f"Converted {chunks_path} to memory-mapped chunk files")
+        return ChunkStore.load(str(index_dir))
+    
+    def _load_fp16_embeddings(self, embeddings_path: Path, meta_path: Path) -> faiss.Index:
+        """
+        Build an exact index from a memory-mapped float16 embeddings file.
+        
+        On CPU, vectors stay float16 in memory (IndexScalarQuantizer with
+        QT_fp16 stores them as-is and upcasts while scanning), so the index
+        takes half the RAM of IndexFlatIP. With a GPU available they are
+        upcast into an IndexFlatIP instead, which _to_gpu can move there.
+        
+        Args:
+            embeddings_path: Path of the (N, d) float16 .npy file
+            meta_path: Path of the JSON file with N, d and dtype
+            
+        Returns:
+            Populated FAISS index
+            
+        Raises:
+            FileNotFoundError: If either file is missing
+        """
+        meta = json.loads(meta_path.read_text())
+        
+        embeddings = np.load(embeddings_path, mmap_mode='r')
+        if embeddings.shape != (meta["n"], meta["d"]):
+            raise ValueError(f"Embeddings file {embeddings_path} does not match {meta_path}")
+        
+        if faiss.get_num_gpus() > 0:
+            index = faiss.IndexFlatIP(meta["d"])
+        else:
+            index = faiss.IndexScalarQuantizer(
+                meta["d"],
+                faiss.ScalarQuantizer.QT_fp16,
+                faiss.METRIC_INNER_PRODUCT
+            )
+        for start in range(0, meta["n"], FP16_LOAD_BLOCK):
+            block = embeddings[start:start + FP16_LOAD_BLOCK]
+            index.add(np.ascontiguousarray(block, dtype=np.float32))
+        
+        return index
+    
+    def print_retrieval_debug(self, query: str, results: List[Tuple[ChunkLike, float]]) -> None:
         """
         Print debug information about retrieved chunks.
         
         Args:
             query: The user query
-            results: List of (PDFChunk, score) tuples
+            results: List of (chunk, score) tuples
         """
-        print("\n" + "="*80)
-        print(f"RETRIEVAL DEBUG - Query: '{query}'")
-        print("="*80)
+        # Build the whole report and write it at once instead of one
+        # print (and line flush) per line
+        lines = ["\n" + "="*80, f"RETRIEVAL DEBUG - Query: '{query}'", "="*80]
         
         for i, (chunk, score) in enumerate(results, 1):
-            print(f"\n[Rank {i}] Score: {score:.4f}")
-            print(f"Page: {chunk.page_number} | Chunk ID: {chunk.chunk_id} | Citation: {chunk.get_citation()}")
-            print(f"Text snippet: {chunk.text[:200]}...")
-            print("-" * 80)
+            lines.append(f"\n[Rank {i}] Score: {score:.4f}")
+            lines.append(f"Page: {chunk.page_number} | Chunk ID: {chunk.chunk_id} | Citation: {chunk.get_citation()}")
+            lines.append(f"Text snippet: {chunk.text[:200]}...")
+            lines.append("-" * 80)
+        
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
     # Test the retriever
     from ingest import PDFIngestor
-    import sys
     
     if len(sys.argv) > 1:
         # Ingest PDF
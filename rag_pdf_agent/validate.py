@@ -77,7 +77,13 @@ def run_validation_tests(agent: RAGChatAgent):
     
     results = []
     
-    for i, test in enumerate(test_questions, 1):
+    # Retrieve for every test question with one batched encode + search
+    retrieved = agent.retriever.retrieve_batch(
+        [test['question'] for test in test_questions],
+        top_k=agent.top_k
+    )
+    
+    for i, (test, retrieved_chunks) in enumerate(zip(test_questions, retrieved), 1):
         print(f"\n{'='*80}")
         print(f"TEST {i}: {test['category']}")
         print(f"{'='*80}")
@@ -86,7 +92,7 @@ def run_validation_tests(agent: RAGChatAgent):
         print(f"\n{'─'*80}")
         
         try:
-            answer = agent.answer_query(test['question'])
+            answer = agent.answer_query(test['question'], retrieved_chunks=retrieved_chunks)
             
             print(f"\nResponse:\n{answer}")
             print(f"\n{'─'*80}")